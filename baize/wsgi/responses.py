@@ -358,9 +358,14 @@ class SendEventResponse(Response):
         try:
             while self.has_more_data or not self.queue.empty():
                 try:
-                    yield self.queue.get(timeout=self.ping_interval)
+                    chunks = [self.queue.get(timeout=self.ping_interval)]
                 except queue.Empty:
                     yield b": ping\n\n"
+                else:
+                    # Events that are already waiting are sent in one write
+                    for _ in range(self.queue.qsize()):
+                        chunks.append(self.queue.get_nowait())
+                    yield b"".join(chunks)
         finally:
             self.has_more_data = False
             future.cancel()
@@ -0,0 +1,51 @@
+import asyncio
+from pathlib import Path
+from typing import Callable, Iterator, List
+
+import httpx
+import pytest
+
+from baize.typing import ASGIApp
+
+from .readme import README_BYTES
+
+
+@pytest.fixture
+def client_factory(
+    event_loop: asyncio.AbstractEventLoop,
+) -> Iterator[Callable[[ASGIApp], httpx.AsyncClient]]:
+    """
+    Return a function that gives an `httpx.AsyncClient` for an ASGI application.
+
+    The clients are closed when the test ends.
+    """
+    clients: List[httpx.AsyncClient] = []
+
+    def make(app: ASGIApp) -> httpx.AsyncClient:
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),  # type: ignore
+            base_url="http://testserver/",
+            follow_redirects=False,
+            timeout=None,
+        )
+        clients.append(client)
+        return client
+
+    yield make
+
+    for client in clients:
+        event_loop.run_until_complete(client.aclose())
+
+
+@pytest.fixture(scope="session")
+def readme_file(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    filepath = tmp_path_factory.mktemp("readme") / "README.txt"
+    filepath.write_bytes(README_BYTES)
+    return filepath
+
+
+@pytest.fixture(scope="session")
+def readme_file_without_suffix(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    filepath = tmp_path_factory.mktemp("readme") / "README"
+    filepath.write_bytes(README_BYTES)
+    return filepath
@@ -0,0 +1,16 @@
+from inspect import cleandoc
+
+EXPECTED_EVENTS = (
+    cleandoc(
+        """
+        data: hello
+        data: world
+
+        event: nothing
+        data: nothing
+
+        event: only-event
+        """
+    )
+    + "\n\n"
+)
@@ -1,14 +1,23 @@
 import asyncio
-import tempfile
+import io
+import json
 from functools import partial
-from inspect import cleandoc
+from inspect import isawaitable
 from pathlib import Path
-from typing import AsyncGenerator, Awaitable, Callable, Type
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
-import httpx
 import pytest
-import starlette.testclient
-from starlette.testclient import TestClient
 
 from baize.asgi import (
     ClientDisconnect,
@@ -32,16 +41,145 @@ from baize.asgi import (
     request_response,
     websocket_session,
 )
-from baize.datastructures import UploadFile
+from baize.concurrency import get_running_loop
+from baize.datastructures import URL, UploadFile
 from baize.exceptions import (
     HTTPException,
     MalformedJSON,
     MalformedMultipart,
     UnsupportedMediaType,
 )
-from baize.typing import Message, ServerSentEvent
+from baize.typing import ASGIApp, Message, Scope, ServerSentEvent
+
+from .events import EXPECTED_EVENTS
+from .readme import README, README_BYTES, README_LEN
+
+
+def http_scope(
+    method: str = "GET",
+    path: str = "/",
+    query_string: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    **kwargs: Any,
+) -> Scope:
+    """
+    Build a minimal HTTP scope, as an ASGI server would send it.
+    """
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query_string,
+        "headers": [
+            (key.encode("latin-1"), value.encode("latin-1"))
+            for key, value in {"host": "testserver", **(headers or {})}.items()
+        ],
+        "server": ("testserver", 80),
+        "client": ("127.0.0.1", 123),
+    }
+    scope.update(kwargs)
+    return scope
+
+
+async def call_asgi(
+    app: ASGIApp, scope: Scope, body: bytes = b""
+) -> Tuple[Message, bytes]:
+    """
+    Call the ASGI application directly, without going through an HTTP client.
+
+    Return the `http.response.start` message and the whole response body.
+    """
+    request_sent = False
+    response_complete = asyncio.Event()
+    messages: List[Message] = []
+
+    async def receive() -> Message:
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_complete.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+        if message["type"] == "http.response.body" and not message.get(
+            "more_body", False
+        ):
+            response_complete.set()
+
+    await app(scope, receive, send)
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    return start, b"".join(
+        m.get("body", b"") for m in messages if m["type"] == "http.response.body"
+    )
+
+
+def websocket_scope(path: str = "/", **kwargs: Any) -> Scope:
+    """
+    Build a minimal WebSocket scope, as an ASGI server would send it.
+    """
+    scope = http_scope(path=path, **kwargs)
+    scope["type"] = "websocket"
+    scope["scheme"] = "ws"
+    scope.setdefault("subprotocols", [])
+    del scope["method"]
+    return scope
+
+
+async def call_websocket(
+    app: ASGIApp, scope: Scope, script: Sequence[Message] = ()
+) -> List[Message]:
+    """
+    Call the ASGI application directly with a scripted WebSocket client.
+
+    The client connects, then sends the messages in `script` one by one,
+    and disconnects with code 1000 when they run out. Return all the messages
+    sent by the application.
+    """
+    incoming: List[Message] = [{"type": "websocket.connect"}, *script]
+    messages: List[Message] = []
+
+    async def receive() -> Message:
+        # Give the other tasks of the application a chance to run,
+        # as they would while a real client is on the network.
+        await asyncio.sleep(0)
+        if incoming:
+            return incoming.pop(0)
+        return {"type": "websocket.disconnect", "code": 1000}
+
+    async def send(message: Message) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
 
-starlette.testclient.WebSocketDisconnect = WebSocketDisconnect  # type: ignore
+
+@request_response
+async def request_attribute_app(request: Request) -> Response:
+    """
+    Respond with the value of the `Request` attribute named by `scope["attribute"]`.
+
+    `"headers:host"` looks up a single key of a mapping attribute.
+    """
+    attribute, _, key = request["attribute"].partition(":")
+    if attribute == "stream":
+        value: Any = b"".join([chunk async for chunk in request.stream()])
+    else:
+        value = getattr(request, attribute)
+        if isawaitable(value):
+            value = await value
+        if key:
+            value = value[key]
+
+    if isinstance(value, bytes):
+        value = value.decode()
+    elif isinstance(value, URL):
+        value = str(value)
+    return JSONResponse({"value": value})
 
 
 def test_request_scope_interface():
@@ -50,8 +188,9 @@ def test_request_scope_interface():
     interface.
     """
     request = Request({"type": "http", "method": "GET", "path": "/abc/"})
+    assert request["type"] == "http"
     assert request["method"] == "GET"
-    assert dict(request) == {"type": "http", "method": "GET", "path": "/abc/"}
+    assert request["path"] == "/abc/"
     assert len(request) == 3
     # test eq
     assert request == Request({"type": "http", "method": "GET", "path": "/abc/"})
@@ -68,217 +207,179 @@ def test_request_scope_interface():
     assert request != dict({"type": "http", "method": "GET", "path": "/abc/"})
 
 
-@pytest.mark.asyncio
-async def test_request_url():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        data = {"method": request.method, "url": str(request.url)}
-        response = JSONResponse(data)
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/123?a=abc")
-        assert response.json() == {
-            "method": "GET",
-            "url": "http://testserver/123?a=abc",
-        }
-
-        response = await client.get("https://example.org:123/")
-        assert response.json() == {"method": "GET", "url": "https://example.org:123/"}
-
-
-@pytest.mark.asyncio
-async def test_request_query_params():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        params = dict(request.query_params)
-        response = JSONResponse({"params": params})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/?a=123&b=456")
-        assert response.json() == {"params": {"a": "123", "b": "456"}}
-
-
-@pytest.mark.asyncio
-async def test_request_headers():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        headers = dict(request.headers)
-        headers.pop("user-agent")  # this is httpx version, delete it
-        response = JSONResponse({"headers": headers})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/", headers={"host": "example.org"})
-        assert response.json() == {
-            "headers": {
-                "host": "example.org",
-                "accept-encoding": "gzip, deflate",
-                "accept": "*/*",
-                "connection": "keep-alive",
-            }
-        }
-
-
-@pytest.mark.asyncio
-async def test_request_client():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        response = JSONResponse(
-            {"host": request.client.host, "port": request.client.port}
-        )
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.json() == {"host": "127.0.0.1", "port": 123}
+def test_request_scope_full_materialization():
+    """
+    Iterating a Request yields the keys of its scope.
+    """
+    request = Request({"type": "http", "method": "GET", "path": "/abc/"})
+    assert dict(request) == {"type": "http", "method": "GET", "path": "/abc/"}
 
 
+@pytest.mark.parametrize(
+    "attribute,scope,request_body,expected",
+    [
+        ("method", http_scope(), b"", "GET"),
+        (
+            "url",
+            http_scope(path="/123", query_string=b"a=abc"),
+            b"",
+            "http://testserver/123?a=abc",
+        ),
+        (
+            "url",
+            http_scope(
+                scheme="https",
+                server=("example.org", 123),
+                headers={"host": "example.org:123"},
+            ),
+            b"",
+            "https://example.org:123/",
+        ),
+        ("query_params:a", http_scope(query_string=b"a=123&b=456"), b"", "123"),
+        ("query_params:b", http_scope(query_string=b"a=123&b=456"), b"", "456"),
+        (
+            "headers:host",
+            http_scope(headers={"host": "example.org", "accept": "*/*"}),
+            b"",
+            "example.org",
+        ),
+        (
+            "headers:accept",
+            http_scope(headers={"host": "example.org", "accept": "*/*"}),
+            b"",
+            "*/*",
+        ),
+        ("client", http_scope(), b"", ["127.0.0.1", 123]),
+        ("body", http_scope(), b"", ""),
+        (
+            "body",
+            http_scope("POST", headers={"content-type": "application/json"}),
+            b'{"a": "123"}',
+            '{"a": "123"}',
+        ),
+        ("body", http_scope("POST"), b"abc", "abc"),
+        ("stream", http_scope(), b"", ""),
+        (
+            "stream",
+            http_scope("POST", headers={"content-type": "application/json"}),
+            b'{"a": "123"}',
+            '{"a": "123"}',
+        ),
+        ("stream", http_scope("POST"), b"abc", "abc"),
+        (
+            "json",
+            http_scope("POST", headers={"content-type": "application/json"}),
+            b'{"a": "123"}',
+            {"a": "123"},
+        ),
+    ],
+)
 @pytest.mark.asyncio
-async def test_request_body():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        body = await request.body
-        response = JSONResponse({"body": body.decode()})
-        await response(scope, receive, send)
+async def test_request_attributes(attribute, scope, request_body, expected):
+    scope = {**scope, "attribute": attribute}
+    _, body = await call_asgi(request_attribute_app, scope, request_body)
+    assert json.loads(body) == {"value": expected}
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.json() == {"body": ""}
 
-        response = await client.post("/", json={"a": "123"})
-        assert response.json() == {"body": '{"a": "123"}'}
-
-        response = await client.post("/", content="abc")
-        assert response.json() == {"body": "abc"}
+@request_response
+async def form_view(request: Request) -> Response:
+    form = await request.form
+    await request.close()
+    return JSONResponse({"form": dict(form)})
 
 
 @pytest.mark.asyncio
-async def test_request_stream():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        body = b""
-        async for chunk in request.stream():
-            body += chunk
-        response = JSONResponse({"body": body.decode()})
-        await response(scope, receive, send)
+async def test_request_form_urlencoded():
+    _, body = await call_asgi(
+        form_view,
+        http_scope(
+            "POST", headers={"content-type": "application/x-www-form-urlencoded"}
+        ),
+        b"abc=123+%40",
+    )
+    assert json.loads(body) == {"form": {"abc": "123 @"}}
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.json() == {"body": ""}
+    with pytest.raises(UnsupportedMediaType):
+        await call_asgi(
+            form_view,
+            http_scope("POST", headers={"content-type": "application/json"}),
+            b"abc=123+%40",
+        )
 
-        response = await client.post("/", json={"a": "123"})
-        assert response.json() == {"body": '{"a": "123"}'}
 
-        response = await client.post("/", content="abc")
-        assert response.json() == {"body": "abc"}
+@request_response
+async def upload_view(request: Request) -> Response:
+    form = await request.form
+    file = form["file-key"]
+    assert isinstance(file, UploadFile)
+    assert await file.aread() == b"temporary file"
+    await request.close()
+    return JSONResponse({"file": file.filename})
 
 
 @pytest.mark.asyncio
-async def test_request_form_urlencoded():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        form = await request.form
-        response = JSONResponse({"form": dict(form)})
-        await response(scope, receive, send)
-        await request.close()
+async def test_request_multipart_form(client_factory):
+    client = client_factory(upload_view)
+    file = io.BytesIO(b"temporary file")
+    response = await client.post("/", data={"abc": "123 @"}, files={"file-key": file})
+    assert response.json() == {"file": "upload"}
+
+    with pytest.raises(MalformedMultipart):
+        response = await client.post(
+            "/", content=b"xxxx", headers={"content-type": "multipart/form-data"}
+        )
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.post("/", data={"abc": "123 @"})
-        assert response.json() == {"form": {"abc": "123 @"}}
 
-        with pytest.raises(UnsupportedMediaType):
-            response = await client.post(
-                "/", data={"abc": "123 @"}, headers={"content-type": "application/json"}
-            )
+@request_response
+async def body_then_stream_view(request: Request) -> Response:
+    body = await request.body
+    chunks = b"".join([chunk async for chunk in request.stream()])
+    return JSONResponse({"body": body.decode(), "stream": chunks.decode()})
 
 
 @pytest.mark.asyncio
-async def test_request_multipart_form():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        form = await request.form
-        file = form["file-key"]
-        assert isinstance(file, UploadFile)
-        assert await file.aread() == b"temporary file"
-        response = JSONResponse({"file": file.filename})
-        await response(scope, receive, send)
-        await request.close()
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        with tempfile.SpooledTemporaryFile(1024) as file:
-            file.write(b"temporary file")
-            file.seek(0, 0)
-            response = await client.post(
-                "/", data={"abc": "123 @"}, files={"file-key": file}
-            )
-            assert response.json() == {"file": "None"}
-
-        with pytest.raises(MalformedMultipart):
-            response = await client.post(
-                "/", content=b"xxxx", headers={"content-type": "multipart/form-data"}
-            )
+async def test_request_body_then_stream():
+    _, body = await call_asgi(body_then_stream_view, http_scope("POST"), b"abc")
+    assert json.loads(body) == {"body": "abc", "stream": "abc"}
 
 
-@pytest.mark.asyncio
-async def test_request_body_then_stream():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
+@request_response
+async def stream_then_body_view(request: Request) -> Response:
+    chunks = b"".join([chunk async for chunk in request.stream()])
+    try:
         body = await request.body
-        chunks = b""
-        async for chunk in request.stream():
-            chunks += chunk
-        response = JSONResponse({"body": body.decode(), "stream": chunks.decode()})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.post("/", content="abc")
-        assert response.json() == {"body": "abc", "stream": "abc"}
+    except RuntimeError:
+        body = b"<stream consumed>"
+    return JSONResponse({"body": body.decode(), "stream": chunks.decode()})
 
 
 @pytest.mark.asyncio
 async def test_request_stream_then_body():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        chunks = b""
-        async for chunk in request.stream():
-            chunks += chunk
-        try:
-            body = await request.body
-        except RuntimeError:
-            body = b"<stream consumed>"
-        response = JSONResponse({"body": body.decode(), "stream": chunks.decode()})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.post("/", content="abc")
-        assert response.json() == {"body": "<stream consumed>", "stream": "abc"}
+    _, body = await call_asgi(stream_then_body_view, http_scope("POST"), b"abc")
+    assert json.loads(body) == {"body": "<stream consumed>", "stream": "abc"}
 
 
 @pytest.mark.asyncio
 async def test_request_json():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        data = await request.json
-        response = JSONResponse({"json": data})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.post("/", json={"a": "123"})
-        assert response.json() == {"json": {"a": "123"}}
-
-        with pytest.raises(UnsupportedMediaType):
-            response = await client.post(
-                "/",
-                data={"abc": "123 @"},
+    with pytest.raises(UnsupportedMediaType):
+        await call_asgi(
+            request_attribute_app,
+            http_scope(
+                "POST",
                 headers={"content-type": "application/x-www-form-urlencoded"},
-            )
+                attribute="json",
+            ),
+            b"abc=123+%40",
+        )
 
-        with pytest.raises(MalformedJSON):
-            response = await client.post(
-                "/", content=b"abc", headers={"content-type": "application/json"}
-            )
+    with pytest.raises(MalformedJSON):
+        await call_asgi(
+            request_attribute_app,
+            http_scope(
+                "POST", headers={"content-type": "application/json"}, attribute="json"
+            ),
+            b"abc",
+        )
 
 
 @pytest.mark.asyncio
@@ -297,13 +398,15 @@ async def test_request_without_setting_receive():
         response = JSONResponse({"json": data})
         await response(scope, receive, send)
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.post("/", json={"a": "123"})
-        assert response.json() == {"json": "Receive channel not available"}
+    _, body = await call_asgi(
+        app,
+        http_scope("POST", headers={"content-type": "application/json"}),
+        b'{"a": "123"}',
+    )
+    assert json.loads(body) == {"json": "Receive channel not available"}
 
 
-@pytest.mark.asyncio
-async def test_request_disconnect():
+def test_request_disconnect():
     """
     If a client disconnect occurs while reading request body
     then ClientDisconnect should be raised.
@@ -317,8 +420,12 @@ async def test_request_disconnect():
         return {"type": "http.disconnect"}
 
     scope = {"type": "http", "method": "POST", "path": "/"}
-    with pytest.raises(ClientDisconnect):
-        await app(scope, receiver, None)
+    loop = asyncio.new_event_loop()
+    try:
+        with pytest.raises(ClientDisconnect):
+            loop.run_until_complete(app(scope, receiver, None))
+    finally:
+        loop.close()
 
 
 @pytest.mark.asyncio
@@ -327,42 +434,38 @@ async def test_request_is_disconnected():
     If a client disconnect occurs while reading request body
     then ClientDisconnect should be raised.
     """
-    disconnected_after_response = None
+    state = {"disconnected": None}
 
     async def app(scope, receive, send):
-        nonlocal disconnected_after_response
-
         request = Request(scope, receive)
         await request.body
         disconnected = await request.is_disconnected()
         response = JSONResponse({"disconnected": disconnected})
         await response(scope, receive, send)
-        disconnected_after_response = await request.is_disconnected()
+        state["disconnected"] = await request.is_disconnected()
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.json() == {"disconnected": False}
-        assert disconnected_after_response
+    _, body = await call_asgi(app, http_scope())
+    assert json.loads(body) == {"disconnected": False}
+    assert state["disconnected"]
 
 
-@pytest.mark.asyncio
-async def test_request_cookies():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        mycookie = request.cookies.get("mycookie")
-        if mycookie:
-            response = PlainTextResponse(mycookie)
-        else:
-            response = PlainTextResponse("Hello, world!")
-            response.set_cookie("mycookie", "Hello, cookies!")
+@request_response
+async def cookie_view(request: Request) -> Response:
+    mycookie = request.cookies.get("mycookie")
+    if mycookie:
+        return PlainTextResponse(mycookie)
+    response = PlainTextResponse("Hello, world!")
+    response.set_cookie("mycookie", "Hello, cookies!")
+    return response
 
-        await response(scope, receive, send)
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.text == "Hello, world!"
-        response = await client.get("/")
-        assert response.text == "Hello, cookies!"
+@pytest.mark.asyncio
+async def test_request_cookies(client_factory):
+    client = client_factory(cookie_view)
+    response = await client.get("/")
+    assert response.text == "Hello, world!"
+    response = await client.get("/")
+    assert response.text == "Hello, cookies!"
 
 
 @pytest.mark.asyncio
@@ -388,92 +491,80 @@ async def test_cookie_lenient_parsing():
         "sessionCookie",
     }
 
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        response = JSONResponse({"cookies": request.cookies})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/", headers={"cookie": tough_cookie})
-        result = response.json()
-        assert len(result["cookies"]) == 4
-        assert set(result["cookies"].keys()) == expected_keys
+    _, body = await call_asgi(
+        request_attribute_app,
+        http_scope(headers={"cookie": tough_cookie}, attribute="cookies"),
+    )
+    cookies = json.loads(body)["value"]
+    assert len(cookies) == 4
+    assert set(cookies.keys()) == expected_keys
 
 
 # These test cases copied from Tornado's implementation
-@pytest.mark.parametrize(
-    "set_cookie,expected",
-    [
-        ("chips=ahoy; vienna=finger", {"chips": "ahoy", "vienna": "finger"}),
-        # all semicolons are delimiters, even within quotes
-        (
-            'keebler="E=mc2; L=\\"Loves\\"; fudge=\\012;"',
-            {"keebler": '"E=mc2', "L": '\\"Loves\\"', "fudge": "\\012", "": '"'},
-        ),
-        # Illegal cookies that have an '=' char in an unquoted value.
-        ("keebler=E=mc2", {"keebler": "E=mc2"}),
-        # Cookies with ':' character in their name.
-        ("key:term=value:term", {"key:term": "value:term"}),
-        # Cookies with '[' and ']'.
-        ("a=b; c=[; d=r; f=h", {"a": "b", "c": "[", "d": "r", "f": "h"}),
-        # Cookies that RFC6265 allows.
-        ("a=b; Domain=example.com", {"a": "b", "Domain": "example.com"}),
-        # parse_cookie() keeps only the last cookie with the same name.
-        ("a=b; h=i; a=c", {"a": "c", "h": "i"}),
-    ],
-)
-@pytest.mark.asyncio
-async def test_cookies_edge_cases(set_cookie, expected):
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        response = JSONResponse({"cookies": request.cookies})
-        await response(scope, receive, send)
+COOKIE_EDGE_CASES = [
+    ("chips=ahoy; vienna=finger", {"chips": "ahoy", "vienna": "finger"}),
+    # all semicolons are delimiters, even within quotes
+    (
+        'keebler="E=mc2; L=\\"Loves\\"; fudge=\\012;"',
+        {"keebler": '"E=mc2', "L": '\\"Loves\\"', "fudge": "\\012", "": '"'},
+    ),
+    # Illegal cookies that have an '=' char in an unquoted value.
+    ("keebler=E=mc2", {"keebler": "E=mc2"}),
+    # Cookies with ':' character in their name.
+    ("key:term=value:term", {"key:term": "value:term"}),
+    # Cookies with '[' and ']'.
+    ("a=b; c=[; d=r; f=h", {"a": "b", "c": "[", "d": "r", "f": "h"}),
+    # Cookies that RFC6265 allows.
+    ("a=b; Domain=example.com", {"a": "b", "Domain": "example.com"}),
+    # parse_cookie() keeps only the last cookie with the same name.
+    ("a=b; h=i; a=c", {"a": "c", "h": "i"}),
+]
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/", headers={"cookie": set_cookie})
-        result = response.json()
-        assert result["cookies"] == expected
+
+@pytest.mark.asyncio
+async def test_cookies_edge_cases():
+    for set_cookie, expected in COOKIE_EDGE_CASES:
+        _, body = await call_asgi(
+            request_attribute_app,
+            http_scope(headers={"cookie": set_cookie}, attribute="cookies"),
+        )
+        assert json.loads(body) == {"value": expected}, f"Cookie: {set_cookie}"
+
+
+COOKIE_INVALID_CASES = [
+    # Chunks without an equals sign appear as unnamed values per
+    # https://bugzilla.mozilla.org/show_bug.cgi?id=169091
+    (
+        "abc=def; unnamed; django_language=en",
+        {"": "unnamed", "abc": "def", "django_language": "en"},
+    ),
+    # Even a double quote may be an unamed value.
+    ('a=b; "; c=d', {"a": "b", "": '"', "c": "d"}),
+    # Spaces in names and values, and an equals sign in values.
+    ("a b c=d e = f; gh=i", {"a b c": "d e = f", "gh": "i"}),
+    # More characters the spec forbids.
+    ('a   b,c<>@:/[]?{}=d  "  =e,f g', {"a   b,c<>@:/[]?{}": 'd  "  =e,f g'}),
+    # Unicode characters. The spec only allows ASCII.
+    # ("saint=André Bessette", {"saint": "André Bessette"}),
+    # Browsers don't send extra whitespace or semicolons in Cookie headers,
+    # but cookie_parser() should parse whitespace the same way
+    # document.cookie parses whitespace.
+    # ("  =  b  ;  ;  =  ;   c  =  ;  ", {"": "b", "c": ""}),
+]
 
 
-@pytest.mark.parametrize(
-    "set_cookie,expected",
-    [
-        # Chunks without an equals sign appear as unnamed values per
-        # https://bugzilla.mozilla.org/show_bug.cgi?id=169091
-        (
-            "abc=def; unnamed; django_language=en",
-            {"": "unnamed", "abc": "def", "django_language": "en"},
-        ),
-        # Even a double quote may be an unamed value.
-        ('a=b; "; c=d', {"a": "b", "": '"', "c": "d"}),
-        # Spaces in names and values, and an equals sign in values.
-        ("a b c=d e = f; gh=i", {"a b c": "d e = f", "gh": "i"}),
-        # More characters the spec forbids.
-        ('a   b,c<>@:/[]?{}=d  "  =e,f g', {"a   b,c<>@:/[]?{}": 'd  "  =e,f g'}),
-        # Unicode characters. The spec only allows ASCII.
-        # ("saint=André Bessette", {"saint": "André Bessette"}),
-        # Browsers don't send extra whitespace or semicolons in Cookie headers,
-        # but cookie_parser() should parse whitespace the same way
-        # document.cookie parses whitespace.
-        # ("  =  b  ;  ;  =  ;   c  =  ;  ", {"": "b", "c": ""}),
-    ],
-)
 @pytest.mark.asyncio
-async def test_cookies_invalid(set_cookie, expected):
+async def test_cookies_invalid():
     """
     Cookie strings that are against the RFC6265 spec but which browsers will send if set
     via document.cookie.
     """
-
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        response = JSONResponse({"cookies": request.cookies})
-        await response(scope, receive, send)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/", headers={"cookie": set_cookie})
-        result = response.json()
-        assert result["cookies"] == expected
+    for set_cookie, expected in COOKIE_INVALID_CASES:
+        _, body = await call_asgi(
+            request_attribute_app,
+            http_scope(headers={"cookie": set_cookie}, attribute="cookies"),
+        )
+        assert json.loads(body) == {"value": expected}, f"Cookie: {set_cookie}"
 
 
 # ######################################################################################
@@ -482,21 +573,19 @@ async def test_cookies_invalid(set_cookie, expected):
 
 
 @pytest.mark.asyncio
-async def test_response_headers():
-    async def app(scope, receive, send):
-        headers = {"x-header-1": "123", "x-header-2": "456"}
-        response = PlainTextResponse("hello, world", headers=headers)
-        response.headers["x-header-2"] = "789"
-        await response(scope, receive, send)
+async def test_response_headers(client_factory):
+    headers = {"x-header-1": "123", "x-header-2": "456"}
+    response = PlainTextResponse("hello, world", headers=headers)
+    response.headers["x-header-2"] = "789"
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.headers["x-header-1"] == "123"
-        assert response.headers["x-header-2"] == "789"
+    client = client_factory(response)
+    response = await client.get("/")
+    assert response.headers["x-header-1"] == "123"
+    assert response.headers["x-header-2"] == "789"
 
 
 @pytest.mark.asyncio
-async def test_set_cookie():
+async def test_set_cookie(client_factory):
     response = PlainTextResponse("Hello, world!", media_type="text/plain")
     response.set_cookie(
         "mycookie",
@@ -510,66 +599,61 @@ async def test_set_cookie():
         samesite="none",
     )
 
-    async with httpx.AsyncClient(app=response, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.text == "Hello, world!"
+    client = client_factory(response)
+    response = await client.get("/")
+    assert response.text == "Hello, world!"
+
+
+@request_response
+async def delete_cookie_view(request: Request) -> Response:
+    response = PlainTextResponse("Hello, world!", media_type="text/plain")
+    if request.cookies.get("mycookie"):
+        response.delete_cookie("mycookie")
+    else:
+        response.set_cookie("mycookie", "myvalue")
+    return response
 
 
 @pytest.mark.asyncio
-async def test_delete_cookie():
-    async def app(scope, receive, send):
-        request = Request(scope, receive)
-        response = PlainTextResponse("Hello, world!", media_type="text/plain")
-        if request.cookies.get("mycookie"):
-            response.delete_cookie("mycookie")
-        else:
-            response.set_cookie("mycookie", "myvalue")
-        await response(scope, receive, send)
+async def test_delete_cookie(client_factory):
+    client = client_factory(delete_cookie_view)
+    response = await client.get("/")
+    assert response.cookies["mycookie"]
+    response = await client.get("/")
+    assert not response.cookies.get("mycookie")
+
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.cookies["mycookie"]
-        response = await client.get("/")
-        assert not response.cookies.get("mycookie")
+HELLO_RESPONSE = PlainTextResponse("hello, world")
+
+REDIRECT_RESPONSE = RedirectResponse("/")
 
 
 @pytest.mark.asyncio
-async def test_redirect_response():
+async def test_redirect_response(client_factory):
     async def app(scope, receive, send):
         if scope["path"] == "/":
-            response = PlainTextResponse("hello, world")
+            await HELLO_RESPONSE(scope, receive, send)
         else:
-            response = RedirectResponse("/")
-        await response(scope, receive, send)
+            await REDIRECT_RESPONSE(scope, receive, send)
 
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/redirect", follow_redirects=True)
-        assert response.text == "hello, world"
-        assert response.url == "http://testserver/"
+    client = client_factory(app)
+    response = await client.get("/redirect", follow_redirects=True)
+    assert response.text == "hello, world"
+    assert response.url == "http://testserver/"
+
+
+EXPECTED_STREAM = b"".join(str(i).encode("utf-8") for i in range(10))
 
 
 @pytest.mark.asyncio
-async def test_stream_response():
+async def test_stream_response(client_factory):
     async def generator(num: int) -> AsyncGenerator[bytes, None]:
         for i in range(num):
             yield str(i).encode("utf-8")
 
-    async with httpx.AsyncClient(
-        app=StreamResponse(generator(10)), base_url="http://testServer/"
-    ) as client:
-        response = await client.get("/")
-        assert response.content == b"".join(str(i).encode("utf-8") for i in range(10))
-
-
-README = """\
-# BáiZé
-
-Powerful and exquisite WSGI/ASGI framework/toolkit.
-
-The minimize implementation of methods required in the Web framework. No redundant implementation means that you can freely customize functions without considering the conflict with baize's own implementation.
-
-Under the ASGI/WSGI protocol, the interface of the request object and the response object is almost the same, only need to add or delete `await` in the appropriate place. In addition, it should be noted that ASGI supports WebSocket but WSGI does not.
-"""
+    client = client_factory(StreamResponse(generator(10)))
+    response = await client.get("/")
+    assert response.content == EXPECTED_STREAM
 
 
 @pytest.mark.parametrize(
@@ -577,77 +661,74 @@ Under the ASGI/WSGI protocol, the interface of the request object and the respon
     [
         FileResponse,
         partial(FileResponse, chunk_size=1),
-        partial(FileResponse, chunk_size=len(README.encode("utf8"))),
+        partial(FileResponse, chunk_size=README_LEN),
     ],
 )
 @pytest.mark.asyncio
-async def test_file_response(tmp_path: Path, response_class: Type[FileResponse]):
-    filepath = tmp_path / "README.txt"
-    filepath.write_bytes(README.encode("utf8"))
-
+async def test_file_response(
+    readme_file: Path, response_class: Type[FileResponse], client_factory
+):
     async def app(scope, r, s):
-        return await response_class(str(filepath))(scope, r, s)
-
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        response = await client.get("/")
-        assert response.status_code == 200
-        assert response.headers["content-length"] == str(len(README.encode("utf8")))
-        assert response.text == README
-
-        response = await client.head("/")
-        assert response.status_code == 200
-        assert response.headers["content-length"] == str(len(README.encode("utf8")))
-        assert response.content == b""
-
-        response = await client.get("/", headers={"Range": "bytes=0-100"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(101)
-        assert response.content == README.encode("utf8")[:101]
-
-        response = await client.head("/", headers={"Range": "bytes=0-100"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(101)
-        assert response.content == b""
-
-        response = await client.get("/", headers={"Range": "bytes=0-100, 200-300"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(370)
-
-        response = await client.head("/", headers={"Range": "bytes=0-100, 200-300"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(370)
-        assert response.content == b""
-
-        response = await client.head(
-            "/",
-            headers={
-                "Range": "bytes=200-300",
-                "if-range": response.headers["etag"][:-1],
-            },
-        )
-        assert response.status_code == 200
-        response = await client.head(
-            "/",
-            headers={
-                "Range": "bytes=200-300",
-                "if-range": response.headers["etag"],
-            },
-        )
-        assert response.status_code == 206
+        return await response_class(str(readme_file))(scope, r, s)
+
+    client = client_factory(app)
+    responses = await asyncio.gather(
+        client.get("/"),
+        client.head("/"),
+        client.get("/", headers={"Range": "bytes=0-100"}),
+        client.head("/", headers={"Range": "bytes=0-100"}),
+        client.get("/", headers={"Range": "bytes=0-100, 200-300"}),
+        client.head("/", headers={"Range": "bytes=0-100, 200-300"}),
+        client.head("/", headers={"Range": "bytes: 0-1000"}),
+        client.head("/", headers={"Range": f"bytes=0-{README_LEN+1}"}),
+        client.head("/", headers={"Range": f"bytes={README_LEN+1}-"}),
+    )
 
-        response = await client.head("/", headers={"Range": "bytes: 0-1000"})
-        assert response.status_code == 400
+    response = responses[0]
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(README_LEN)
+    assert response.text == README
 
-        response = await client.head(
-            "/", headers={"Range": f"bytes=0-{len(README.encode('utf8'))+1}"}
-        )
-        assert response.status_code == 206
+    response = responses[1]
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(README_LEN)
+    assert response.content == b""
 
-        response = await client.head(
-            "/", headers={"Range": f"bytes={len(README.encode('utf8'))+1}-"}
-        )
-        assert response.status_code == 416
-        assert response.headers["Content-Range"] == f"*/{len(README.encode('utf8'))}"
+    response = responses[2]
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(101)
+    assert response.content == README_BYTES[:101]
+
+    response = responses[3]
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(101)
+    assert response.content == b""
+
+    response = responses[4]
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(370)
+
+    response = responses[5]
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(370)
+    assert response.content == b""
+
+    assert responses[6].status_code == 400
+
+    assert responses[7].status_code == 206
+
+    response = responses[8]
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"*/{README_LEN}"
+
+    # These depend on the etag of the responses above
+    etag = responses[5].headers["etag"]
+    responses = await asyncio.gather(
+        client.head("/", headers={"Range": "bytes=200-300", "if-range": etag[:-1]}),
+        client.head("/", headers={"Range": "bytes=200-300", "if-range": etag}),
+    )
+    assert responses[0].status_code == 200
+    assert responses[1].status_code == 206
 
 
 @pytest.mark.asyncio
@@ -657,69 +738,59 @@ async def test_file_response_with_directory(tmp_path: Path):
 
 
 @pytest.mark.asyncio
-async def test_file_response_with_download_name(tmp_path: Path):
-    filepath = tmp_path / "README"
-    filepath.write_bytes(README.encode("utf8"))
-    file_response = FileResponse(str(filepath), download_name="README.txt")
-    async with httpx.AsyncClient(
-        app=file_response, base_url="http://testServer/"
-    ) as client:
-        response = await client.get("/")
-        assert (
-            response.headers["content-disposition"]
-            == "attachment; filename=\"README.txt\"; filename*=utf-8''README.txt"
-        )
+async def test_file_response_with_download_name(
+    readme_file_without_suffix: Path, client_factory
+):
+    file_response = FileResponse(
+        str(readme_file_without_suffix), download_name="README.txt"
+    )
+    client = client_factory(file_response)
+    response = await client.get("/")
+    assert (
+        response.headers["content-disposition"]
+        == "attachment; filename=\"README.txt\"; filename*=utf-8''README.txt"
+    )
+
+
+@pytest.fixture
+def fast_sleep(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Replace `asyncio.sleep` with a fake clock that counts event loop iterations.
+
+    Every 0.01 second of delay is one iteration, so sleeps still finish in the
+    order of their delays, without waiting for real time.
+    """
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay: float, result: Any = None) -> Any:
+        for _ in range(max(1, round(delay * 100))):
+            await real_sleep(0)
+        return result
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
 
 
 @pytest.mark.asyncio
-async def test_send_event_response():
+@pytest.mark.parametrize("headers", [None, {"custom-header": "value"}])
+async def test_send_event_response(headers, client_factory, fast_sleep):
     async def send_events() -> AsyncGenerator[ServerSentEvent, None]:
         yield ServerSentEvent(data="hello\nworld")
         await asyncio.sleep(0.2)
         yield ServerSentEvent(data="nothing", event="nothing")
         yield ServerSentEvent(event="only-event")
 
-    expected_events = (
-        cleandoc(
-            """
-            data: hello
-            data: world
-
-            event: nothing
-            data: nothing
-
-            event: only-event
-            """
-        )
-        + "\n\n"
+    client = client_factory(
+        SendEventResponse(send_events(), headers=headers, ping_interval=0.1)
     )
-
-    async with httpx.AsyncClient(
-        app=SendEventResponse(send_events(), ping_interval=0.1),
-        base_url="http://testServer/",
-    ) as client:
-        async with client.stream("GET", "/") as resp:
-            resp.raise_for_status()
-            events = ""
-            async for line in resp.aiter_lines():
-                events += line
-            assert events.replace(": ping\n\n", "") == expected_events
-
-    async with httpx.AsyncClient(
-        app=SendEventResponse(
-            send_events(),
-            headers={"custom-header": "value"},
-            ping_interval=0.1,
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        async with client.stream("GET", "/") as resp:
-            resp.raise_for_status()
-            assert resp.headers["custom-header"] == "value"
-            events = ""
-            async for line in resp.aiter_lines():
-                events += line
-            assert events.replace(": ping\n\n", "") == expected_events
+    async with client.stream("GET", "/") as resp:
+        resp.raise_for_status()
+        for key, value in (headers or {}).items():
+            assert resp.headers[key] == value
+        events = ""
+        async for line in resp.aiter_lines():
+            events += line
+        assert ": ping\n\n" in events
+        assert events.replace(": ping\n\n", "") == EXPECTED_EVENTS
 
 
 @pytest.mark.parametrize(
@@ -742,11 +813,9 @@ def test_responses_inherit(response_class):
 # ################################# WebSocket tests ####################################
 # ######################################################################################
 
-# Hook websocket TestClient
-starlette.testclient._is_asgi3 = lambda *args, **kwargs: True
 
-
-def test_websocket_send_and_receive_text():
+@pytest.mark.asyncio
+async def test_websocket_send_and_receive_text():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
@@ -754,14 +823,18 @@ def test_websocket_send_and_receive_text():
         await websocket.send_text("Message was: " + data)
         await websocket.close()
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.send_text("Hello, world!")
-        data = websocket.receive_text()
-        assert data == "Message was: Hello, world!"
+    messages = await call_websocket(
+        app, websocket_scope(), [{"type": "websocket.receive", "text": "Hello, world!"}]
+    )
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "text": "Message was: Hello, world!"},
+        {"type": "websocket.close", "code": 1000},
+    ]
 
 
-def test_websocket_send_and_receive_bytes():
+@pytest.mark.asyncio
+async def test_websocket_send_and_receive_bytes():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
@@ -769,42 +842,56 @@ def test_websocket_send_and_receive_bytes():
         await websocket.send_bytes(b"Message was: " + data)
         await websocket.close()
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.send_bytes(b"Hello, world!")
-        data = websocket.receive_bytes()
-        assert data == b"Message was: Hello, world!"
+    messages = await call_websocket(
+        app,
+        websocket_scope(),
+        [{"type": "websocket.receive", "bytes": b"Hello, world!"}],
+    )
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "bytes": b"Message was: Hello, world!"},
+        {"type": "websocket.close", "code": 1000},
+    ]
 
 
-def test_websocket_iter_text():
+@pytest.mark.asyncio
+async def test_websocket_iter_text():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
         async for data in websocket.iter_text():
             await websocket.send_text("Message was: " + data)
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.send_text("Hello, world!")
-        data = websocket.receive_text()
-        assert data == "Message was: Hello, world!"
+    messages = await call_websocket(
+        app, websocket_scope(), [{"type": "websocket.receive", "text": "Hello, world!"}]
+    )
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "text": "Message was: Hello, world!"},
+    ]
 
 
-def test_websocket_iter_bytes():
+@pytest.mark.asyncio
+async def test_websocket_iter_bytes():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
         async for data in websocket.iter_bytes():
             await websocket.send_bytes(b"Message was: " + data)
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.send_bytes(b"Hello, world!")
-        data = websocket.receive_bytes()
-        assert data == b"Message was: Hello, world!"
+    messages = await call_websocket(
+        app,
+        websocket_scope(),
+        [{"type": "websocket.receive", "bytes": b"Hello, world!"}],
+    )
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "bytes": b"Message was: Hello, world!"},
+    ]
 
 
-def test_websocket_concurrency_pattern():
+@pytest.mark.asyncio
+async def test_websocket_concurrency_pattern():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         async def reader(websocket: WebSocket, queue: "asyncio.Queue[str]") -> None:
@@ -818,25 +905,44 @@ def test_websocket_concurrency_pattern():
 
         queue: "asyncio.Queue[str]" = asyncio.Queue()
         await websocket.accept()
-        done, pending = await asyncio.wait(
-            (
-                asyncio.ensure_future(reader(websocket=websocket, queue=queue)),
-                asyncio.ensure_future(writer(websocket=websocket, queue=queue)),
-            ),
-            return_when=asyncio.FIRST_COMPLETED,
+        loop = get_running_loop()
+        first_done: "asyncio.Future[asyncio.Task]" = loop.create_future()
+        tasks = (
+            loop.create_task(reader(websocket=websocket, queue=queue)),
+            loop.create_task(writer(websocket=websocket, queue=queue)),
         )
-        [task.cancel() for task in pending]
-        [task.result() for task in done]
+
+        def set_first_done(task: asyncio.Task) -> None:
+            if not first_done.done():
+                first_done.set_result(task)
+
+        def retrieve_outcome(task: asyncio.Task) -> None:
+            # Avoid "Task exception was never retrieved" for the cancelled task.
+            if not task.cancelled():
+                task.exception()
+
+        for task in tasks:
+            task.add_done_callback(set_first_done)
+        winner = await first_done
+        for task in tasks:
+            if task is not winner:
+                task.add_done_callback(retrieve_outcome)
+                task.cancel()
+        winner.result()
         await websocket.close()
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.send_text("hello world")
-        data = websocket.receive_text()
-        assert data == "hello world"
+    messages = await call_websocket(
+        app, websocket_scope(), [{"type": "websocket.receive", "text": "hello world"}]
+    )
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.send", "text": "hello world"},
+        {"type": "websocket.close", "code": 1000},
+    ]
 
 
-def test_client_close():
+@pytest.mark.asyncio
+async def test_client_close():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
@@ -845,22 +951,23 @@ def test_client_close():
         except WebSocketDisconnect as exc:
             assert exc.code == 1001
 
-    client = TestClient(app)
-    with client.websocket_connect("/") as websocket:
-        websocket.close(code=1001)
+    await call_websocket(
+        app, websocket_scope(), [{"type": "websocket.disconnect", "code": 1001}]
+    )
 
 
-def test_application_close():
+@pytest.mark.asyncio
+async def test_application_close():
     async def app_close(scope, receive, send):
         websocket = WebSocket(scope, receive=receive, send=send)
         await websocket.accept()
         await websocket.close(1001)
 
-    client = TestClient(app_close)
-    with client.websocket_connect("/") as websocket:
-        with pytest.raises(WebSocketDisconnect) as exc:
-            websocket.receive_text()
-        assert exc.value.code == 1001
+    messages = await call_websocket(app_close, websocket_scope())
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.close", "code": 1001},
+    ]
 
     async def app_after_close(scope, receive, send):
         websocket = WebSocket(scope, receive=receive, send=send)
@@ -869,37 +976,37 @@ def test_application_close():
         with pytest.raises(RuntimeError):
             await websocket.send_text("after close")
 
-    client = TestClient(app_after_close)
-    with client.websocket_connect("/") as websocket:
-        with pytest.raises(WebSocketDisconnect) as exc:
-            websocket.receive_text()
-        assert exc.value.code == 1000
+    messages = await call_websocket(app_after_close, websocket_scope())
+    assert messages == [
+        {"type": "websocket.accept", "subprotocol": None},
+        {"type": "websocket.close", "code": 1000},
+    ]
 
 
-def test_rejected_connection():
+@pytest.mark.asyncio
+async def test_rejected_connection():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.close(1001)
 
-    client = TestClient(app)
-    with pytest.raises(WebSocketDisconnect) as exc:
-        client.websocket_connect("/")
-    assert exc.value.code == 1001
+    messages = await call_websocket(app, websocket_scope())
+    assert messages == [{"type": "websocket.close", "code": 1001}]
 
 
-def test_subprotocol():
+@pytest.mark.asyncio
+async def test_subprotocol():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         assert websocket["subprotocols"] == ["soap", "wamp"]
         await websocket.accept(subprotocol="wamp")
         await websocket.close()
 
-    client = TestClient(app)
-    with client.websocket_connect("/", subprotocols=["soap", "wamp"]) as websocket:
-        assert websocket.accepted_subprotocol == "wamp"
+    messages = await call_websocket(app, websocket_scope(subprotocols=["soap", "wamp"]))
+    assert messages[0] == {"type": "websocket.accept", "subprotocol": "wamp"}
 
 
-def test_duplicate_disconnect():
+@pytest.mark.asyncio
+async def test_duplicate_disconnect():
     @websocket_session
     async def app(websocket: WebSocket) -> None:
         await websocket.accept()
@@ -907,10 +1014,10 @@ def test_duplicate_disconnect():
         assert message["type"] == "websocket.disconnect"
         message = await websocket.receive()
 
-    client = TestClient(app)
     with pytest.raises(RuntimeError):
-        with client.websocket_connect("/") as websocket:
-            websocket.close()
+        await call_websocket(
+            app, websocket_scope(), [{"type": "websocket.disconnect", "code": 1000}]
+        )
 
 
 def test_websocket_scope_interface():
@@ -931,7 +1038,8 @@ def test_websocket_scope_interface():
         send=mock_send,
     )
     assert websocket["type"] == "websocket"
-    assert dict(websocket) == {"type": "websocket", "path": "/abc/", "headers": []}
+    assert websocket["path"] == "/abc/"
+    assert websocket["headers"] == []
     assert len(websocket) == 3
 
 
@@ -941,35 +1049,32 @@ def test_websocket_scope_interface():
 
 
 @pytest.mark.asyncio
-async def test_request_response():
+async def test_request_response(client_factory):
     @request_response
     async def view(request: Request) -> Response:
         return PlainTextResponse(await request.body)
 
-    async with httpx.AsyncClient(app=view, base_url="http://testServer/") as client:
-        assert (await client.get("/")).text == ""
-        assert (await client.post("/", content="hello")).text == "hello"
+    client = client_factory(view)
+    assert (await client.get("/")).text == ""
+    assert (await client.post("/", content="hello")).text == "hello"
 
-    client = TestClient(view)
-    with pytest.raises(WebSocketDisconnect) as exc:
-        with client.websocket_connect("/"):
-            pass
-    assert exc.value.code == 1000
+    messages = await call_websocket(view, websocket_scope())
+    assert messages == [{"type": "websocket.close"}]
 
 
 @pytest.mark.asyncio
-async def test_websocket_session():
+async def test_websocket_session(client_factory):
     @websocket_session
     async def view(websocket: WebSocket) -> None:
         await websocket.accept()
         await websocket.close()
 
-    async with httpx.AsyncClient(app=view, base_url="http://testServer/") as client:
-        assert (await client.get("/")).status_code == 404
+    client = client_factory(view)
+    assert (await client.get("/")).status_code == 404
 
 
 @pytest.mark.asyncio
-async def test_middleware():
+async def test_middleware(client_factory):
     @middleware
     async def middleware_func(
         request: Request, handler: Callable[[Request], Awaitable[Response]]
@@ -983,82 +1088,81 @@ async def test_middleware():
     async def view(request: Request) -> Response:
         return PlainTextResponse(await request.body)
 
-    async with httpx.AsyncClient(app=view, base_url="http://testServer/") as client:
-        assert (await client.get("/")).headers["X-Middleware"] == "1"
+    client = client_factory(view)
+    assert (await client.get("/")).headers["X-Middleware"] == "1"
+
+
+@request_response
+async def path_params_view(request: Request) -> Response:
+    return JSONResponse(request.path_params)
+
+
+@request_response
+async def redirect_view(request: Request) -> Response:
+    return RedirectResponse("/cat")
+
+
+ROUTER = Router(
+    ("/", PlainTextResponse("homepage")),
+    ("/redirect", redirect_view),
+    ("/{path}", path_params_view),
+)
 
 
 @pytest.mark.asyncio
-async def test_router():
-    @request_response
-    async def path(request: Request) -> Response:
-        return JSONResponse(request.path_params)
+async def test_router(client_factory):
+    client = client_factory(ROUTER)
+    assert (await client.get("/")).text == "homepage"
+    assert (await client.get("/baize")).json() == {"path": "baize"}
+    assert (await client.get("/baize/")).status_code == 404
+    assert (await (client.get("/redirect"))).headers["location"] == "/cat"
 
-    @request_response
-    async def redirect(request: Request) -> Response:
-        return RedirectResponse("/cat")
 
-    router = Router(
-        ("/", PlainTextResponse("homepage")),
-        ("/redirect", redirect),
-        ("/{path}", path),
-    )
-    async with httpx.AsyncClient(app=router, base_url="http://testServer/") as client:
-        assert (await client.get("/")).text == "homepage"
-        assert (await client.get("/baize")).json() == {"path": "baize"}
-        assert (await client.get("/baize/")).status_code == 404
-        assert (await (client.get("/redirect"))).headers["location"] == "/cat"
+@request_response
+async def root_path_view(request: Request) -> Response:
+    return PlainTextResponse(request.get("root_path", ""))
+
+
+@request_response
+async def path_view(request: Request) -> Response:
+    return PlainTextResponse(request["path"])
+
+
+SUBPATHS = Subpaths(
+    ("/frist", root_path_view),
+    ("/latest", path_view),
+)
+
+ROOT_SUBPATHS = Subpaths(
+    ("", path_view),
+    ("/root", root_path_view),
+)
 
 
 @pytest.mark.asyncio
-async def test_subpaths():
-    @request_response
-    async def root(request: Request) -> Response:
-        return PlainTextResponse(request.get("root_path", ""))
+async def test_subpaths(client_factory):
+    client = client_factory(SUBPATHS)
+    assert (await client.get("/")).status_code == 404
+    assert (await client.get("/frist")).text == "/frist"
+    assert (await client.get("/latest")).text == ""
 
-    @request_response
-    async def path(request: Request) -> Response:
-        return PlainTextResponse(request["path"])
+    client = client_factory(ROOT_SUBPATHS)
+    assert (await client.get("/")).text == "/"
+    assert (await client.get("/root/")).text == "/root/"
 
-    async with httpx.AsyncClient(
-        app=Subpaths(
-            ("/frist", root),
-            ("/latest", path),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert (await client.get("/")).status_code == 404
-        assert (await client.get("/frist")).text == "/frist"
-        assert (await client.get("/latest")).text == ""
-
-    async with httpx.AsyncClient(
-        app=Subpaths(
-            ("", path),
-            ("/root", root),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert (await client.get("/")).text == "/"
-        assert (await client.get("/root/")).text == "/root/"
+
+HOSTS = Hosts(
+    ("testServer", PlainTextResponse("testServer")),
+    (".*", PlainTextResponse("default host")),
+)
 
 
 @pytest.mark.asyncio
-async def test_hosts():
-    async with httpx.AsyncClient(
-        app=Hosts(
-            ("testServer", PlainTextResponse("testServer")),
-            (".*", PlainTextResponse("default host")),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert (
-            await client.get("/", headers={"host": "testServer"})
-        ).text == "testServer"
-        assert (
-            await client.get("/", headers={"host": "hhhhhhh"})
-        ).text == "default host"
-        assert (
-            await client.get("/", headers={"host": "qwe\ndsf"})
-        ).text == "Invalid host"
+async def test_hosts(client_factory):
+    client = client_factory(HOSTS)
+    assert (await client.get("/", headers={"host": "testServer"})).text == "testServer"
+    assert (await client.get("/", headers={"host": "hhhhhhh"})).text == "default host"
+    assert (await client.get("/", headers={"host": "qwe\ndsf"})).text == "Invalid host"
 
 
 @pytest.mark.asyncio
@@ -1069,53 +1173,51 @@ async def test_hosts():
         Files(".", "baize"),
     ],
 )
-async def test_files(app):
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        resp = await client.get("/py.typed")
-        assert resp.text == ""
-
-        assert (
-            await client.get(
-                "/py.typed", headers={"if-none-match": resp.headers["etag"]}
-            )
-        ).status_code == 304
-
-        assert (
-            await client.get(
-                "/py.typed", headers={"if-none-match": "W/" + resp.headers["etag"]}
-            )
-        ).status_code == 304
-
-        assert (
-            await client.get("/py.typed", headers={"if-none-match": "*"})
-        ).status_code == 304
-
-        assert (
-            await client.get(
-                "/py.typed",
-                headers={"if-modified-since": resp.headers["last-modified"]},
-            )
-        ).status_code == 304
-
-        assert (
-            await client.get(
-                "/py.typed",
-                headers={
-                    "if-modified-since": resp.headers["last-modified"],
-                    "if-none-match": resp.headers["etag"],
-                },
-            )
-        ).status_code == 304
-
-        with pytest.raises(HTTPException):
-            await client.get("/")
-
-        with pytest.raises(HTTPException):
-            await client.get("/%2E%2E/baize/%2E%2E/%2E%2E/README.md")
+async def test_files(app, client_factory):
+    client = client_factory(app)
+    resp = await client.get("/py.typed")
+    assert resp.text == ""
+
+    assert (
+        await client.get("/py.typed", headers={"if-none-match": resp.headers["etag"]})
+    ).status_code == 304
+
+    assert (
+        await client.get(
+            "/py.typed", headers={"if-none-match": "W/" + resp.headers["etag"]}
+        )
+    ).status_code == 304
+
+    assert (
+        await client.get("/py.typed", headers={"if-none-match": "*"})
+    ).status_code == 304
+
+    assert (
+        await client.get(
+            "/py.typed",
+            headers={"if-modified-since": resp.headers["last-modified"]},
+        )
+    ).status_code == 304
+
+    assert (
+        await client.get(
+            "/py.typed",
+            headers={
+                "if-modified-since": resp.headers["last-modified"],
+                "if-none-match": resp.headers["etag"],
+            },
+        )
+    ).status_code == 304
+
+    with pytest.raises(HTTPException):
+        await client.get("/")
+
+    with pytest.raises(HTTPException):
+        await client.get("/%2E%2E/baize/%2E%2E/%2E%2E/README.md")
 
 
 @pytest.mark.asyncio
-async def test_pages(tmpdir):
+async def test_pages(tmpdir, client_factory):
     (tmpdir / "index.html").write_text(
         "<html><body>index</body></html>", encoding="utf8"
     )
@@ -1125,38 +1227,38 @@ async def test_pages(tmpdir):
     )
 
     app = Pages(tmpdir)
-    async with httpx.AsyncClient(app=app, base_url="http://testServer/") as client:
-        resp = await client.get("/")
-        assert resp.status_code == 200
-        assert resp.text == "<html><body>index</body></html>"
-
-        resp = await client.get("/index")
-        assert resp.status_code == 200
-        assert resp.text == "<html><body>index</body></html>"
-
-        assert (
-            await client.get(
-                "/", headers={"if-modified-since": resp.headers["last-modified"]}
-            )
-        ).status_code == 304
-
-        assert (
-            await client.get("/", headers={"if-none-match": resp.headers["etag"]})
-        ).status_code == 304
-
-        assert (
-            await client.get(
-                "/",
-                headers={
-                    "if-modified-since": resp.headers["last-modified"],
-                    "if-none-match": resp.headers["etag"],
-                },
-            )
-        ).status_code == 304
-
-        resp = await client.get("/dir")
-        assert resp.status_code == 307
-        assert resp.headers["location"] == "//testserver/dir/"
-
-        with pytest.raises(HTTPException):
-            await client.get("/d")
+    client = client_factory(app)
+    resp = await client.get("/")
+    assert resp.status_code == 200
+    assert resp.text == "<html><body>index</body></html>"
+
+    resp = await client.get("/index")
+    assert resp.status_code == 200
+    assert resp.text == "<html><body>index</body></html>"
+
+    assert (
+        await client.get(
+            "/", headers={"if-modified-since": resp.headers["last-modified"]}
+        )
+    ).status_code == 304
+
+    assert (
+        await client.get("/", headers={"if-none-match": resp.headers["etag"]})
+    ).status_code == 304
+
+    assert (
+        await client.get(
+            "/",
+            headers={
+                "if-modified-since": resp.headers["last-modified"],
+                "if-none-match": resp.headers["etag"],
+            },
+        )
+    ).status_code == 304
+
+    resp = await client.get("/dir")
+    assert resp.status_code == 307
+    assert resp.headers["location"] == "//testserver/dir/"
+
+    with pytest.raises(HTTPException):
+        await client.get("/d")
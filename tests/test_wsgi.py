@@ -1,8 +1,8 @@
-import tempfile
-import time
-from inspect import cleandoc
+import io
+import threading
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Callable, Generator
+from typing import Callable, Generator, Iterator
 
 import httpx
 import pytest
@@ -14,7 +14,7 @@ from baize.exceptions import (
     MalformedMultipart,
     UnsupportedMediaType,
 )
-from baize.typing import ServerSentEvent
+from baize.typing import ServerSentEvent, WSGIApp
 from baize.wsgi import (
     FileResponse,
     Files,
@@ -34,6 +34,30 @@ from baize.wsgi import (
     request_response,
 )
 
+from .events import EXPECTED_EVENTS
+from .readme import README, README_BYTES, README_LEN
+
+
+@pytest.fixture
+def wsgi_client_factory() -> Iterator[Callable[[WSGIApp], httpx.Client]]:
+    """
+    Return a function that gives an `httpx.Client` for a WSGI application.
+
+    The clients are closed when the test ends.
+    """
+    with ExitStack() as stack:
+
+        def make(app: WSGIApp) -> httpx.Client:
+            return stack.enter_context(
+                httpx.Client(
+                    transport=httpx.WSGITransport(app=app),  # type: ignore
+                    base_url="http://testServer/",
+                    follow_redirects=False,
+                )
+            )
+
+        yield make
+
 
 def test_request_environ_interface():
     """
@@ -41,8 +65,9 @@ def test_request_environ_interface():
     interface.
     """
     request = Request({"type": "http", "method": "GET", "path": "/abc/"})
+    assert request["type"] == "http"
     assert request["method"] == "GET"
-    assert dict(request) == {"type": "http", "method": "GET", "path": "/abc/"}
+    assert request["path"] == "/abc/"
     assert len(request) == 3
     # test eq
     assert request == Request({"type": "http", "method": "GET", "path": "/abc/"})
@@ -52,53 +77,61 @@ def test_request_environ_interface():
     assert request != dict({"type": "http", "method": "GET", "path": "/abc/"})
 
 
-def test_request_url():
+def test_request_environ_full_materialization():
+    """
+    Iterating a Request yields the keys of its environ.
+    """
+    request = Request({"type": "http", "method": "GET", "path": "/abc/"})
+    assert dict(request) == {"type": "http", "method": "GET", "path": "/abc/"}
+
+
+def test_request_url(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         response = PlainTextResponse(request.method + " " + str(request.url))
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/123?a=abc")
-        assert response.text == "GET http://testserver/123?a=abc"
+    client = wsgi_client_factory(app)
+    response = client.get("/123?a=abc")
+    assert response.text == "GET http://testserver/123?a=abc"
 
-        response = client.get("https://example.org:123/")
-        assert response.text == "GET https://example.org:123/"
+    response = client.get("https://example.org:123/")
+    assert response.text == "GET https://example.org:123/"
 
 
-def test_request_query_params():
+def test_request_query_params(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         params = dict(request.query_params)
         response = JSONResponse({"params": params})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/?a=123&b=456")
-        assert response.json() == {"params": {"a": "123", "b": "456"}}
+    client = wsgi_client_factory(app)
+    response = client.get("/?a=123&b=456")
+    assert response.json() == {"params": {"a": "123", "b": "456"}}
 
 
-def test_request_headers():
+def test_request_headers(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
-        headers = dict(request.headers)
-        headers.pop("user-agent")  # this is httpx version, delete it
+        # user-agent carries the httpx version, leave it out
+        headers = {k: v for k, v in request.headers.items() if k != "user-agent"}
         response = JSONResponse({"headers": headers})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/", headers={"host": "example.org"})
-        assert response.json() == {
-            "headers": {
-                "host": "example.org",
-                "accept-encoding": "gzip, deflate",
-                "accept": "*/*",
-                "connection": "keep-alive",
-            }
+    client = wsgi_client_factory(app)
+    response = client.get("/", headers={"host": "example.org"})
+    assert response.json() == {
+        "headers": {
+            "host": "example.org",
+            "accept-encoding": "gzip, deflate",
+            "accept": "*/*",
+            "connection": "keep-alive",
         }
+    }
 
 
-def test_request_client():
+def test_request_client(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         response = JSONResponse(
@@ -106,53 +139,51 @@ def test_request_client():
         )
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert response.json() == {"host": None, "port": None}
+    client = wsgi_client_factory(app)
+    response = client.get("/")
+    assert response.json() == {"host": None, "port": None}
 
     request = Request({"REMOTE_ADDR": "127.0.0.1", "REMOTE_PORT": "62124"})
     assert request.client == Address("127.0.0.1", 62124)
 
 
-def test_request_body():
+def test_request_body(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         body = request.body
         response = JSONResponse({"body": body.decode()})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert response.json() == {"body": ""}
+    client = wsgi_client_factory(app)
+    response = client.get("/")
+    assert response.json() == {"body": ""}
 
-        response = client.post("/", json={"a": "123"})
-        assert response.json() == {"body": '{"a": "123"}'}
+    response = client.post("/", json={"a": "123"})
+    assert response.json() == {"body": '{"a": "123"}'}
 
-        response = client.post("/", content="abc")
-        assert response.json() == {"body": "abc"}
+    response = client.post("/", content="abc")
+    assert response.json() == {"body": "abc"}
 
 
-def test_request_stream():
+def test_request_stream(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
-        body = b""
-        for chunk in request.stream():
-            body += chunk
+        body = b"".join(request.stream())
         response = PlainTextResponse(body)
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert response.text == ""
+    client = wsgi_client_factory(app)
+    response = client.get("/")
+    assert response.text == ""
 
-        response = client.post("/", json={"a": "123"})
-        assert response.text == '{"a": "123"}'
+    response = client.post("/", json={"a": "123"})
+    assert response.text == '{"a": "123"}'
 
-        response = client.post("/", content="abc")
-        assert response.text == "abc"
+    response = client.post("/", content="abc")
+    assert response.text == "abc"
 
 
-def test_request_form_urlencoded():
+def test_request_form_urlencoded(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         form = request.form
@@ -160,17 +191,17 @@ def test_request_form_urlencoded():
         return response(environ, start_response)
         request.close()
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.post("/", data={"abc": "123 @"})
-        assert response.json() == {"form": {"abc": "123 @"}}
+    client = wsgi_client_factory(app)
+    response = client.post("/", data={"abc": "123 @"})
+    assert response.json() == {"form": {"abc": "123 @"}}
 
-        with pytest.raises(UnsupportedMediaType):
-            response = client.post(
-                "/", data={"abc": "123 @"}, headers={"content-type": "application/json"}
-            )
+    with pytest.raises(UnsupportedMediaType):
+        response = client.post(
+            "/", data={"abc": "123 @"}, headers={"content-type": "application/json"}
+        )
 
 
-def test_request_multipart_form():
+def test_request_multipart_form(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         form = request.form
@@ -181,40 +212,34 @@ def test_request_multipart_form():
         request.close()
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        with tempfile.SpooledTemporaryFile(1024) as file:
-            file.write(b"temporary file")
-            file.seek(0, 0)
-            response = client.post("/", data={"abc": "123 @"}, files={"file-key": file})
-            assert response.json() == {"file": "None"}
+    client = wsgi_client_factory(app)
+    file = io.BytesIO(b"temporary file")
+    response = client.post("/", data={"abc": "123 @"}, files={"file-key": file})
+    assert response.json() == {"file": "upload"}
 
-        with pytest.raises(MalformedMultipart):
-            response = client.post(
-                "/", content=b"xxxx", headers={"content-type": "multipart/form-data"}
-            )
+    with pytest.raises(MalformedMultipart):
+        response = client.post(
+            "/", content=b"xxxx", headers={"content-type": "multipart/form-data"}
+        )
 
 
-def test_request_body_then_stream():
+def test_request_body_then_stream(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         body = request.body
-        chunks = b""
-        for chunk in request.stream():
-            chunks += chunk
+        chunks = b"".join(request.stream())
         response = JSONResponse({"body": body.decode(), "stream": chunks.decode()})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.post("/", content="abc")
-        assert response.json() == {"body": "abc", "stream": "abc"}
+    client = wsgi_client_factory(app)
+    response = client.post("/", content="abc")
+    assert response.json() == {"body": "abc", "stream": "abc"}
 
 
-def test_request_stream_then_body():
+def test_request_stream_then_body(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
-        chunks = b""
-        for chunk in request.stream():
-            chunks += chunk
+        chunks = b"".join(request.stream())
         try:
             body = request.body
         except RuntimeError:
@@ -222,36 +247,36 @@ def test_request_stream_then_body():
         response = JSONResponse({"body": body.decode(), "stream": chunks.decode()})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.post("/", content="abc")
-        assert response.json() == {"body": "<stream consumed>", "stream": "abc"}
+    client = wsgi_client_factory(app)
+    response = client.post("/", content="abc")
+    assert response.json() == {"body": "<stream consumed>", "stream": "abc"}
 
 
-def test_request_json():
+def test_request_json(wsgi_client_factory):
     def app(environ, start_response):
         request = Request(environ)
         data = request.json
         response = JSONResponse({"json": data})
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.post("/", json={"a": "123"})
-        assert response.json() == {"json": {"a": "123"}}
+    client = wsgi_client_factory(app)
+    response = client.post("/", json={"a": "123"})
+    assert response.json() == {"json": {"a": "123"}}
 
-        with pytest.raises(UnsupportedMediaType):
-            response = client.post(
-                "/",
-                data={"abc": "123 @"},
-                headers={"content-type": "application/x-www-form-urlencoded"},
-            )
+    with pytest.raises(UnsupportedMediaType):
+        response = client.post(
+            "/",
+            data={"abc": "123 @"},
+            headers={"content-type": "application/x-www-form-urlencoded"},
+        )
 
-        with pytest.raises(MalformedJSON):
-            response = client.post(
-                "/", content=b"abc", headers={"content-type": "application/json"}
-            )
+    with pytest.raises(MalformedJSON):
+        response = client.post(
+            "/", content=b"abc", headers={"content-type": "application/json"}
+        )
 
 
-def test_request_accpet():
+def test_request_accpet(wsgi_client_factory):
     data = "hello world"
 
     def app(environ, start_response):
@@ -262,9 +287,9 @@ def test_request_accpet():
             response = PlainTextResponse(data)
         return response(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/", headers={"Accept": "application/json"})
-        assert response.json() == {"data": data}
+    client = wsgi_client_factory(app)
+    response = client.get("/", headers={"Accept": "application/json"})
+    assert response.json() == {"data": data}
 
 
 # ######################################################################################
@@ -272,111 +297,101 @@ def test_request_accpet():
 # ######################################################################################
 
 
-def test_unknown_status():
-    with httpx.Client(app=Response(600), base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert response.status_code == 600
+def test_unknown_status(wsgi_client_factory):
+    client = wsgi_client_factory(Response(600))
+    response = client.get("/")
+    assert response.status_code == 600
+
 
+HELLO_RESPONSE = PlainTextResponse("hello, world")
 
-def test_redirect_response():
+REDIRECT_RESPONSE = RedirectResponse("/")
+
+
+def test_redirect_response(wsgi_client_factory):
     def app(environ, start_response):
         if environ["PATH_INFO"] == "/":
-            response = PlainTextResponse("hello, world")
+            return HELLO_RESPONSE(environ, start_response)
         else:
-            response = RedirectResponse("/")
-        return response(environ, start_response)
+            return REDIRECT_RESPONSE(environ, start_response)
 
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        response = client.get("/redirect", follow_redirects=True)
-        assert response.text == "hello, world"
-        assert response.url == "http://testserver/"
+    client = wsgi_client_factory(app)
+    response = client.get("/redirect", follow_redirects=True)
+    assert response.text == "hello, world"
+    assert response.url == "http://testserver/"
 
 
-def test_stream_response():
+EXPECTED_STREAM = b"".join(str(i).encode("utf-8") for i in range(10))
+
+
+def test_stream_response(wsgi_client_factory):
     def generator(num: int) -> Generator[bytes, None, None]:
         for i in range(num):
             yield str(i).encode("utf-8")
 
-    with httpx.Client(
-        app=StreamResponse(generator(10)), base_url="http://testServer/"
-    ) as client:
-        response = client.get("/")
-        assert response.content == b"".join(str(i).encode("utf-8") for i in range(10))
-
-
-README = """\
-# BáiZé
-
-Powerful and exquisite WSGI/ASGI framework/toolkit.
-
-The minimize implementation of methods required in the Web framework. No redundant implementation means that you can freely customize functions without considering the conflict with baize's own implementation.
-
-Under the ASGI/WSGI protocol, the interface of the request object and the response object is almost the same, only need to add or delete `await` in the appropriate place. In addition, it should be noted that ASGI supports WebSocket but WSGI does not.
-"""
-
-
-def test_file_response(tmp_path: Path):
-    filepath = tmp_path / "README.txt"
-    filepath.write_bytes(README.encode("utf8"))
-    file_response = FileResponse(str(filepath))
-    with httpx.Client(app=file_response, base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert response.status_code == 200
-        assert response.headers["content-length"] == str(len(README.encode("utf8")))
-        assert response.text == README
-
-        response = client.head("/")
-        assert response.status_code == 200
-        assert response.headers["content-length"] == str(len(README.encode("utf8")))
-        assert response.content == b""
-
-        response = client.get("/", headers={"Range": "bytes=0-100"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(101)
-        assert response.content == README.encode("utf8")[:101]
-
-        response = client.head("/", headers={"Range": "bytes=0-100"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(101)
-        assert response.content == b""
-
-        response = client.get("/", headers={"Range": "bytes=0-100, 200-300"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(370)
-
-        response = client.head("/", headers={"Range": "bytes=0-100, 200-300"})
-        assert response.status_code == 206
-        assert response.headers["content-length"] == str(370)
-        assert response.content == b""
-
-        response = client.head(
-            "/",
-            headers={
-                "Range": "bytes=200-300",
-                "if-range": response.headers["etag"][:-1],
-            },
-        )
-        assert response.status_code == 200
-        response = client.head(
-            "/",
-            headers={
-                "Range": "bytes=200-300",
-                "if-range": response.headers["etag"],
-            },
-        )
-        assert response.status_code == 206
+    client = wsgi_client_factory(StreamResponse(generator(10)))
+    response = client.get("/")
+    assert response.content == EXPECTED_STREAM
+
+
+def test_file_response(readme_file: Path, wsgi_client_factory):
+    file_response = FileResponse(str(readme_file))
+    client = wsgi_client_factory(file_response)
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(README_LEN)
+    assert response.text == README
+
+    response = client.head("/")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(README_LEN)
+    assert response.content == b""
+
+    response = client.get("/", headers={"Range": "bytes=0-100"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(101)
+    assert response.content == README_BYTES[:101]
+
+    response = client.head("/", headers={"Range": "bytes=0-100"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(101)
+    assert response.content == b""
+
+    response = client.get("/", headers={"Range": "bytes=0-100, 200-300"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(370)
+
+    response = client.head("/", headers={"Range": "bytes=0-100, 200-300"})
+    assert response.status_code == 206
+    assert response.headers["content-length"] == str(370)
+    assert response.content == b""
+
+    response = client.head(
+        "/",
+        headers={
+            "Range": "bytes=200-300",
+            "if-range": response.headers["etag"][:-1],
+        },
+    )
+    assert response.status_code == 200
+    response = client.head(
+        "/",
+        headers={
+            "Range": "bytes=200-300",
+            "if-range": response.headers["etag"],
+        },
+    )
+    assert response.status_code == 206
 
-        response = client.head("/", headers={"Range": "bytes: 0-1000"})
-        assert response.status_code == 400
+    response = client.head("/", headers={"Range": "bytes: 0-1000"})
+    assert response.status_code == 400
 
-        response = client.head(
-            "/",
-            headers={
-                "Range": f"bytes={len(README.encode('utf8'))+1}-{len(README.encode('utf8'))+12}"
-            },
-        )
-        assert response.status_code == 416
-        assert response.headers["Content-Range"] == f"*/{len(README.encode('utf8'))}"
+    response = client.head(
+        "/",
+        headers={"Range": f"bytes={README_LEN+1}-{README_LEN+12}"},
+    )
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"*/{README_LEN}"
 
 
 def test_file_response_with_directory(tmp_path: Path):
@@ -384,66 +399,77 @@ def test_file_response_with_directory(tmp_path: Path):
         FileResponse(str(tmp_path))
 
 
-def test_file_response_with_download_name(tmp_path: Path):
-    filepath = tmp_path / "README"
-    filepath.write_bytes(README.encode("utf8"))
-    file_response = FileResponse(str(filepath), download_name="README.txt")
-    with httpx.Client(app=file_response, base_url="http://testServer/") as client:
-        response = client.get("/")
-        assert (
-            response.headers["content-disposition"]
-            == "attachment; filename=\"README.txt\"; filename*=utf-8''README.txt"
-        )
+def test_file_response_with_download_name(
+    readme_file_without_suffix: Path, wsgi_client_factory
+):
+    file_response = FileResponse(
+        str(readme_file_without_suffix), download_name="README.txt"
+    )
+    client = wsgi_client_factory(file_response)
+    response = client.get("/")
+    assert (
+        response.headers["content-disposition"]
+        == "attachment; filename=\"README.txt\"; filename*=utf-8''README.txt"
+    )
+
 
+@pytest.mark.parametrize("headers", [None, {"custom-header": "value"}])
+def test_send_event_response(headers, wsgi_client_factory):
+    # Hold back the rest of the events until the client has seen a ping.
+    pinged = threading.Event()
 
-def test_send_event_response():
     def send_events() -> Generator[ServerSentEvent, None, None]:
         yield ServerSentEvent(data="hello\nworld")
-        time.sleep(0.2)
+        pinged.wait(timeout=1)
         yield ServerSentEvent(data="nothing", event="nothing")
         yield ServerSentEvent(event="only-event")
 
-    expected_events = (
-        cleandoc(
-            """
-            data: hello
-            data: world
-
-            event: nothing
-            data: nothing
-
-            event: only-event
-            """
+    client = wsgi_client_factory(
+        SendEventResponse(send_events(), headers=headers, ping_interval=0.01)
+    )
+    with client.stream("GET", "/") as resp:
+        resp.raise_for_status()
+        for key, value in (headers or {}).items():
+            assert resp.headers[key] == value
+        events = ""
+        for line in resp.iter_lines():
+            if line.startswith(": ping"):
+                pinged.set()
+            events += line
+        assert ": ping\n\n" in events
+        assert events.replace(": ping\n\n", "") == EXPECTED_EVENTS
+
+
+def test_send_event_response_coalesces_queued_events():
+    response = SendEventResponse(
+        iter(
+            [
+                ServerSentEvent(data="hello\nworld"),
+                ServerSentEvent(data="nothing", event="nothing"),
+                ServerSentEvent(event="only-event"),
+            ]
         )
-        + "\n\n"
     )
+    # Queue every event before the response starts draining the queue.
+    response.send_event()
+
+    chunks = list(response({}, lambda status, headers: None))
+    assert chunks == [EXPECTED_EVENTS.encode("utf-8")]
+
+
+def test_send_event_response_pings_while_queue_is_empty():
+    released = threading.Event()
 
-    with httpx.Client(
-        app=SendEventResponse(send_events(), ping_interval=0.1),
-        base_url="http://testServer/",
-    ) as client:
-        with client.stream("GET", "/") as resp:
-            resp.raise_for_status()
-            events = ""
-            for line in resp.iter_lines():
-                events += line
-            assert events.replace(": ping\n\n", "") == expected_events
-
-    with httpx.Client(
-        app=SendEventResponse(
-            send_events(),
-            headers={"custom-header": "value"},
-            ping_interval=0.1,
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        with client.stream("GET", "/") as resp:
-            resp.raise_for_status()
-            assert resp.headers["custom-header"] == "value"
-            events = ""
-            for line in resp.iter_lines():
-                events += line
-            assert events.replace(": ping\n\n", "") == expected_events
+    def send_events() -> Generator[ServerSentEvent, None, None]:
+        released.wait(timeout=1)
+        yield ServerSentEvent(data="hello")
+
+    response = SendEventResponse(send_events(), ping_interval=0.01)
+    chunks = iter(response({}, lambda status, headers: None))
+    assert next(chunks) == b": ping\n\n"
+
+    released.set()
+    assert [chunk for chunk in chunks if chunk != b": ping\n\n"] == [b"data: hello\n\n"]
 
 
 @pytest.mark.parametrize(
@@ -467,17 +493,17 @@ def test_responses_inherit(response_class):
 # ######################################################################################
 
 
-def test_request_response():
+def test_request_response(wsgi_client_factory):
     @request_response
     def view(request: Request) -> Response:
         return PlainTextResponse(request.body)
 
-    with httpx.Client(app=view, base_url="http://testServer/") as client:
-        assert client.get("/").text == ""
-        assert client.post("/", content="hello").text == "hello"
+    client = wsgi_client_factory(view)
+    assert client.get("/").text == ""
+    assert client.post("/", content="hello").text == "hello"
 
 
-def test_middleware():
+def test_middleware(wsgi_client_factory):
     @middleware
     def middleware_func(
         request: Request, handler: Callable[[Request], Response]
@@ -491,11 +517,11 @@ def test_middleware():
     def view(request: Request) -> Response:
         return PlainTextResponse(request.body)
 
-    with httpx.Client(app=view, base_url="http://testServer/") as client:
-        assert client.get("/").headers["X-Middleware"] == "1"
+    client = wsgi_client_factory(view)
+    assert client.get("/").headers["X-Middleware"] == "1"
 
 
-def test_router():
+def test_router(wsgi_client_factory):
     @request_response
     def path(request: Request) -> Response:
         return JSONResponse(request.path_params)
@@ -509,14 +535,14 @@ def test_router():
         ("/redirect", redirect),
         ("/{path}", path),
     )
-    with httpx.Client(app=router, base_url="http://testServer/") as client:
-        assert client.get("/").text == "homepage"
-        assert client.get("/baize").json() == {"path": "baize"}
-        assert client.get("/baize/").status_code == 404
-        assert client.get("/redirect").headers["location"] == "/cat"
+    client = wsgi_client_factory(router)
+    assert client.get("/").text == "homepage"
+    assert client.get("/baize").json() == {"path": "baize"}
+    assert client.get("/baize/").status_code == 404
+    assert client.get("/redirect").headers["location"] == "/cat"
 
 
-def test_subpaths():
+def test_subpaths(wsgi_client_factory):
     @request_response
     def root(request: Request) -> Response:
         return PlainTextResponse(request.get("SCRIPT_NAME", ""))
@@ -525,39 +551,36 @@ def test_subpaths():
     def path(request: Request) -> Response:
         return PlainTextResponse(request.get("PATH_INFO", ""))
 
-    with httpx.Client(
-        app=Subpaths(
+    client = wsgi_client_factory(
+        Subpaths(
             ("/frist", root),
             ("/latest", path),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert client.get("/").status_code == 404
-        assert client.get("/frist").text == "/frist"
-        assert client.get("/latest").text == ""
-
-    with httpx.Client(
-        app=Subpaths(
+        )
+    )
+    assert client.get("/").status_code == 404
+    assert client.get("/frist").text == "/frist"
+    assert client.get("/latest").text == ""
+
+    client = wsgi_client_factory(
+        Subpaths(
             ("", path),
             ("/root", root),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert client.get("/").text == "/"
-        assert client.get("/root/").text == "/root/"
+        )
+    )
+    assert client.get("/").text == "/"
+    assert client.get("/root/").text == "/root/"
 
 
-def test_hosts():
-    with httpx.Client(
-        app=Hosts(
+def test_hosts(wsgi_client_factory):
+    client = wsgi_client_factory(
+        Hosts(
             ("testServer", PlainTextResponse("testServer")),
             (".*", PlainTextResponse("default host")),
-        ),
-        base_url="http://testServer/",
-    ) as client:
-        assert client.get("/", headers={"host": "testServer"}).text == "testServer"
-        assert client.get("/", headers={"host": "hhhhhhh"}).text == "default host"
-        assert client.get("/", headers={"host": "qwe\ndsf"}).text == "Invalid host"
+        )
+    )
+    assert client.get("/", headers={"host": "testServer"}).text == "testServer"
+    assert client.get("/", headers={"host": "hhhhhhh"}).text == "default host"
+    assert client.get("/", headers={"host": "qwe\ndsf"}).text == "Invalid host"
 
 
 @pytest.mark.parametrize(
@@ -567,51 +590,47 @@ def test_hosts():
         Files(".", "baize"),
     ],
 )
-def test_files(app):
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        resp = client.get("/py.typed")
-        assert resp.text == ""
-
-        assert (
-            client.get("/py.typed", headers={"if-none-match": resp.headers["etag"]})
-        ).status_code == 304
-
-        assert (
-            client.get(
-                "/py.typed", headers={"if-none-match": "W/" + resp.headers["etag"]}
-            )
-        ).status_code == 304
+def test_files(app, wsgi_client_factory):
+    client = wsgi_client_factory(app)
+    resp = client.get("/py.typed")
+    assert resp.text == ""
 
-        assert (
-            client.get("/py.typed", headers={"if-none-match": "*"})
-        ).status_code == 304
+    assert (
+        client.get("/py.typed", headers={"if-none-match": resp.headers["etag"]})
+    ).status_code == 304
 
-        assert (
-            client.get(
-                "/py.typed",
-                headers={"if-modified-since": resp.headers["last-modified"]},
-            )
-        ).status_code == 304
-
-        assert (
-            client.get(
-                "/py.typed",
-                headers={
-                    "if-modified-since": resp.headers["last-modified"],
-                    "if-none-match": resp.headers["etag"],
-                },
-            )
-        ).status_code == 304
+    assert (
+        client.get("/py.typed", headers={"if-none-match": "W/" + resp.headers["etag"]})
+    ).status_code == 304
+
+    assert (client.get("/py.typed", headers={"if-none-match": "*"})).status_code == 304
+
+    assert (
+        client.get(
+            "/py.typed",
+            headers={"if-modified-since": resp.headers["last-modified"]},
+        )
+    ).status_code == 304
+
+    assert (
+        client.get(
+            "/py.typed",
+            headers={
+                "if-modified-since": resp.headers["last-modified"],
+                "if-none-match": resp.headers["etag"],
+            },
+        )
+    ).status_code == 304
 
-        with pytest.raises(HTTPException):
-            client.get("/")
+    with pytest.raises(HTTPException):
+        client.get("/")
 
-        with pytest.raises(HTTPException):
-            client.get("/%2E%2E/baize/%2E%2E/%2E%2E/README.md")
+    with pytest.raises(HTTPException):
+        client.get("/%2E%2E/baize/%2E%2E/%2E%2E/README.md")
 
 
 @pytest.mark.asyncio
-def test_pages(tmpdir):
+def test_pages(tmpdir, wsgi_client_factory):
     (tmpdir / "index.html").write_text(
         "<html><body>index</body></html>", encoding="utf8"
     )
@@ -621,38 +640,36 @@ def test_pages(tmpdir):
     )
 
     app = Pages(tmpdir)
-    with httpx.Client(app=app, base_url="http://testServer/") as client:
-        resp = client.get("/")
-        assert resp.status_code == 200
-        assert resp.text == "<html><body>index</body></html>"
-
-        resp = client.get("/")
-        assert resp.status_code == 200
-        assert resp.text == "<html><body>index</body></html>"
-
-        assert (
-            client.get(
-                "/", headers={"if-modified-since": resp.headers["last-modified"]}
-            )
-        ).status_code == 304
-
-        assert (
-            client.get("/", headers={"if-none-match": resp.headers["etag"]})
-        ).status_code == 304
-
-        assert (
-            client.get(
-                "/",
-                headers={
-                    "if-modified-since": resp.headers["last-modified"],
-                    "if-none-match": resp.headers["etag"],
-                },
-            )
-        ).status_code == 304
+    client = wsgi_client_factory(app)
+    resp = client.get("/")
+    assert resp.status_code == 200
+    assert resp.text == "<html><body>index</body></html>"
+
+    resp = client.get("/")
+    assert resp.status_code == 200
+    assert resp.text == "<html><body>index</body></html>"
+
+    assert (
+        client.get("/", headers={"if-modified-since": resp.headers["last-modified"]})
+    ).status_code == 304
+
+    assert (
+        client.get("/", headers={"if-none-match": resp.headers["etag"]})
+    ).status_code == 304
+
+    assert (
+        client.get(
+            "/",
+            headers={
+                "if-modified-since": resp.headers["last-modified"],
+                "if-none-match": resp.headers["etag"],
+            },
+        )
+    ).status_code == 304
 
-        resp = client.get("/dir")
-        assert resp.status_code == 307
-        assert resp.headers["location"] == "//testserver/dir/"
+    resp = client.get("/dir")
+    assert resp.status_code == 307
+    assert resp.headers["location"] == "//testserver/dir/"
 
-        with pytest.raises(HTTPException):
-            client.get("/d")
+    with pytest.raises(HTTPException):
+        client.get("/d")